@@ -1,58 +1,94 @@
 import os
-import io
+import re
 import json
-from typing import Optional, List
+import asyncio
+import hashlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import BinaryIO, Optional, List
 
 from fastapi import FastAPI, Request, HTTPException, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
+import httpx
+import orjson
+import tiktoken
 
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
 
-from openai import OpenAI
+from celery import Celery
+from celery.exceptions import BackendError
+from celery.result import AsyncResult
+from celery.signals import worker_process_shutdown
+from kombu.exceptions import OperationalError
 
-from docx import Document
-from pdfminer.high_level import extract_text as pdf_extract_text
+from openai import (
+    AsyncOpenAI,
+    APIConnectionError,
+    APITimeoutError,
+    BadRequestError,
+    InternalServerError,
+    RateLimitError,
+)
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception_type,
+    retry_if_not_exception_type,
+    stop_after_attempt,
+    stop_before_delay,
+    wait_random_exponential,
+)
 
-# ------------------ APP & MIDDLEWARE ------------------
+try:
+    import redis.asyncio as redis_async
+    from redis.exceptions import RedisError
+except ImportError:  # redis is optional for local dev
+    redis_async = None
+    RedisError = None
 
-app = FastAPI(title="ResuMatch.ai")
+try:
+    import faiss
+    import numpy as np
+except ImportError:  # semantic cache is disabled without faiss
+    faiss = None
+    np = None
 
-# Allow frontend to call backend
-FRONTEND_ORIGIN = "*"  # later: replace "*" with your frontend URL
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[FRONTEND_ORIGIN],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Rate limiting
-limiter = Limiter(key_func=get_remote_address, enabled=True)
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-app.add_middleware(SlowAPIMiddleware)
+from docx import Document
+import pymupdf
 
-# ------------------ HEALTH & KEY CHECK ------------------
+# ------------------ OPENAI CLIENT ------------------
 
-@app.get("/")
-def health():
-    return {"status": "ok", "message": "ResuMatch backend is running"}
+# The client itself is created per worker in lifespan (app.state.openai)
+OPENAI_MAX_CONNECTIONS = 200
+OPENAI_MAX_KEEPALIVE = 100
+OPENAI_TIMEOUT_SECONDS = 60
 
-@app.get("/check-key")
-def check_key():
-    key = os.environ.get("OPENAI_API_KEY", "")
-    if not key:
-        return {"status": "missing", "message": "OPENAI_API_KEY not found"}
-    return {"status": "ok", "key_starts_with": key[:10] + "..."}
+# Bound concurrent upstream calls so bursts stay under the account's RPM tier
+OPENAI_MAX_CONCURRENCY = int(os.environ.get("OPENAI_MAX_CONCURRENCY", "16"))
 
-# ------------------ OPENAI CLIENT ------------------
+OPENAI_MODEL = "gpt-4o-mini"
+TEMPERATURE = 0.4
 
-api_key = os.environ.get("OPENAI_API_KEY", "")
-client = OpenAI(api_key=api_key)
+# Transient upstream failures worth retrying; anything else is surfaced as-is.
+# APITimeoutError is an APIConnectionError but is never retried: the attempt has
+# already used the whole timeout, and repeating it would hold the caller's
+# connection for minutes.
+_RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+# A combined batch call that times out or drops is not resent as a whole;
+# its requests fall back to individual calls instead
+_BATCH_RETRYABLE_ERRORS = (RateLimitError, InternalServerError)
+OPENAI_MAX_ATTEMPTS = 4
+# No retry starts after this many seconds, so together with the timeout a call
+# finishes within about OPENAI_RETRY_DEADLINE_SECONDS + OPENAI_TIMEOUT_SECONDS
+OPENAI_RETRY_DEADLINE_SECONDS = int(os.environ.get("OPENAI_RETRY_DEADLINE_SECONDS", "30"))
 
 # ------------------ MODELS ------------------
 
@@ -73,8 +109,213 @@ class TailorResponse(BaseModel):
     cover_letter: str
     sections: List[TailoredSection]
 
+class TailorBatchItem(TailorResponse):
+    # 1-based position of the candidate in the batch prompt, echoed back
+    candidate: int
+
+class TailorBatchResponse(BaseModel):
+    results: List[TailorBatchItem]
+
+# ------------------ TOKEN BUDGET ------------------
+
+# Oversized inputs are truncated to a per-field token budget before prompting;
+# anything beyond the hard limit is rejected outright.
+# tiktoken downloads the encoding on first use unless TIKTOKEN_CACHE_DIR already
+# holds it (pre-seed that directory in the image to run without network). It is
+# loaded on the first tailor request rather than at startup, so the app still
+# boots, and health checks and parsing still work, if the download fails.
+RESUME_TOKEN_BUDGET = int(os.environ.get("RESUME_TOKEN_BUDGET", "4000"))
+JOB_TOKEN_BUDGET = int(os.environ.get("JOB_TOKEN_BUDGET", "2000"))
+PROMPT_TOKEN_HARD_LIMIT = int(os.environ.get("PROMPT_TOKEN_HARD_LIMIT", "60000"))
+
+def _load_encoding():
+    # tiktoken keeps loaded encodings in memory, so only the first call is slow
+    try:
+        return tiktoken.encoding_for_model(OPENAI_MODEL)
+    except Exception as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Tokenizer unavailable: {type(e).__name__}: {e}"
+        )
+
+def _fit_to_budget(req: TailorRequest) -> TailorRequest:
+    encoding = _load_encoding()
+    # encode_ordinary so user text containing "<|endoftext|>" etc. isn't rejected
+    resume_tokens = encoding.encode_ordinary(req.resume_text)
+    job_tokens = encoding.encode_ordinary(req.job_text)
+    instruction_tokens = encoding.encode_ordinary(req.instructions or "")
+    total = len(resume_tokens) + len(job_tokens) + len(instruction_tokens)
+    if total > PROMPT_TOKEN_HARD_LIMIT:
+        raise HTTPException(
+            status_code=413,
+            detail="Resume and job description are too long. Please shorten them and try again."
+        )
+
+    update = {}
+    if len(resume_tokens) > RESUME_TOKEN_BUDGET:
+        update["resume_text"] = encoding.decode(resume_tokens[:RESUME_TOKEN_BUDGET])
+    if len(job_tokens) > JOB_TOKEN_BUDGET:
+        update["job_text"] = encoding.decode(job_tokens[:JOB_TOKEN_BUDGET])
+    return req.model_copy(update=update) if update else req
+
+# ------------------ RESPONSE CACHE ------------------
+
+# Shared by the rate limiter, the response cache and Celery; unset means
+# in-process only
+REDIS_URL = os.environ.get("REDIS_URL", "")
+
+# Exact-match cache of serialized TailorResponse JSON, keyed on the full request.
+# Uses Redis (app.state.redis) when REDIS_URL is set, otherwise a small
+# in-process LRU (app.state.local_cache) for local dev.
+# Entries store sections column-wise (headings + bullets) rather than as a list
+# of {heading, bullets} objects; the wire format is rebuilt on the way out.
+CACHE_TTL_SECONDS = int(os.environ.get("TAILOR_CACHE_TTL", "86400"))
+LOCAL_CACHE_MAX_ENTRIES = int(os.environ.get("TAILOR_LOCAL_CACHE_SIZE", "256"))
+
+# Output for these requests isn't meant to repeat, so caching would be wrong.
+# Matched as whole words, so e.g. "randomized" or "todays" don't count.
+_VOLATILE_MARKERS = ("today", "current date", "this week", "random", "surprise me")
+_VOLATILE_PATTERN = re.compile(
+    r"\b(?:" + "|".join(re.escape(m) for m in _VOLATILE_MARKERS) + r")\b",
+    re.IGNORECASE,
+)
+
+def _sections_to_soa(sections: List[TailoredSection]) -> dict:
+    return {
+        "headings": [s.heading for s in sections],
+        "bullets": [s.bullets for s in sections],
+    }
+
+def _sections_from_soa(headings: List[str], bullets: List[List[str]]) -> List[dict]:
+    return [{"heading": h, "bullets": b} for h, b in zip(headings, bullets)]
+
+def _pack_response(resp: TailorResponse) -> bytes:
+    return orjson.dumps({
+        "summary": resp.summary,
+        "improved_resume": resp.improved_resume,
+        "cover_letter": resp.cover_letter,
+        **_sections_to_soa(resp.sections),
+    })
+
+def _unpack_response(raw: bytes) -> dict:
+    data = orjson.loads(raw)
+    return {
+        "summary": data["summary"],
+        "improved_resume": data["improved_resume"],
+        "cover_letter": data["cover_letter"],
+        "sections": _sections_from_soa(data["headings"], data["bullets"]),
+    }
+
+def _cache_key(req: TailorRequest) -> str:
+    payload = json.dumps(req.model_dump(), sort_keys=True)
+    return "tailor:v2:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _is_cacheable(req: TailorRequest) -> bool:
+    return _VOLATILE_PATTERN.search(req.instructions or "") is None
+
+async def _cache_get(state, key: str) -> Optional[bytes]:
+    if state.redis is not None:
+        try:
+            return await state.redis.get(key)
+        except Exception:
+            # A cache outage should never fail the request
+            return None
+
+    cached = state.local_cache.get(key)
+    if cached is not None:
+        state.local_cache.move_to_end(key)
+    return cached
+
+async def _cache_set(state, key: str, value: bytes) -> None:
+    if state.redis is not None:
+        try:
+            await state.redis.set(key, value, ex=CACHE_TTL_SECONDS)
+        except Exception:
+            pass
+        return
+
+    state.local_cache[key] = value
+    state.local_cache.move_to_end(key)
+    while len(state.local_cache) > LOCAL_CACHE_MAX_ENTRIES:
+        state.local_cache.popitem(last=False)
+
+# ------------------ SEMANTIC CACHE ------------------
+
+# Opt-in (SEMANTIC_CACHE=1): a request for the same resume with a near-duplicate
+# job description, e.g. a small JD edit, reuses the stored response. The resume
+# must match exactly (its hash is one of the compared fields), so a response is
+# never served to a different candidate, and only the JD is embedded.
+# Vectors live in an in-process FAISS inner-product index over normalized
+# embeddings (app.state.semantic_index), so scores are cosine similarities.
+# Index ids map to app.state.semantic_entries, oldest first: the request fields
+# that must match plus the packed response. app.state.semantic_by_resume holds
+# each resume's ids so a lookup only searches that resume's entries.
+# Once full, the oldest entry is evicted.
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIM = 1536
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.97"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_SIZE", "1000"))
+SEMANTIC_CACHE_ENABLED = faiss is not None and os.environ.get("SEMANTIC_CACHE", "0") != "0"
+_SEMANTIC_TOP_K = 4
+
+def _semantic_fields(req: TailorRequest) -> dict:
+    return {
+        "resume": hashlib.sha256(req.resume_text.encode("utf-8")).hexdigest(),
+        "target_title": req.target_title,
+        "tone": req.tone,
+        "instructions": req.instructions,
+    }
+
+async def _embed(state, req: TailorRequest):
+    # Already cut to JOB_TOKEN_BUDGET, well inside the embedding model's limit
+    async with state.openai_semaphore:
+        result = await state.openai.embeddings.create(
+            model=EMBEDDING_MODEL, input=req.job_text
+        )
+    vec = np.asarray([result.data[0].embedding], dtype="float32")
+    faiss.normalize_L2(vec)
+    return vec
+
+def _semantic_lookup(state, req: TailorRequest, vec) -> Optional[bytes]:
+    fields = _semantic_fields(req)
+    ids = state.semantic_by_resume.get(fields["resume"])
+    if not ids:
+        return None
+    params = faiss.SearchParameters(
+        sel=faiss.IDSelectorBatch(np.fromiter(ids, dtype="int64", count=len(ids)))
+    )
+    k = min(_SEMANTIC_TOP_K, len(ids))
+    scores, found = state.semantic_index.search(vec, k, params=params)
+    for score, entry_id in zip(scores[0], found[0]):
+        if entry_id < 0 or score < SEMANTIC_CACHE_THRESHOLD:
+            break
+        entry = state.semantic_entries[int(entry_id)]
+        if entry["fields"] == fields:
+            return entry["response"]
+    return None
+
+def _semantic_store(state, req: TailorRequest, vec, packed: bytes) -> None:
+    while len(state.semantic_entries) >= SEMANTIC_CACHE_MAX_ENTRIES:
+        old_id, old = state.semantic_entries.popitem(last=False)
+        state.semantic_index.remove_ids(np.asarray([old_id], dtype="int64"))
+        resume_ids = state.semantic_by_resume[old["fields"]["resume"]]
+        resume_ids.discard(old_id)
+        if not resume_ids:
+            del state.semantic_by_resume[old["fields"]["resume"]]
+
+    entry_id = state.semantic_next_id
+    state.semantic_next_id += 1
+    fields = _semantic_fields(req)
+    state.semantic_index.add_with_ids(vec, np.asarray([entry_id], dtype="int64"))
+    state.semantic_entries[entry_id] = {"fields": fields, "response": packed}
+    state.semantic_by_resume.setdefault(fields["resume"], set()).add(entry_id)
+
 # ------------------ PROMPT HELPERS ------------------
 
+# Kept byte-identical across requests (no f-strings, dates, or user data) so
+# OpenAI's automatic prompt caching can reuse it as a prefix; it must stay over
+# 1024 tokens for that to kick in. Everything request-specific goes in the
+# user message built by _user_prompt.
 SYSTEM_PROMPT = """You are ResuMatch.ai, a senior resume writer.
 Rules:
 - Rewrite to fit the job description precisely.
@@ -85,100 +326,859 @@ Rules:
 - Output concise, scannable bullets.
 - Always respond as a single JSON object with keys:
   summary, improved_resume, cover_letter, sections (array of {heading, bullets[]})
-"""
-
-def _user_prompt(req: TailorRequest) -> str:
-    role = req.target_title or "the target role"
-    return f"""
-Target Title: {role}
-Tone: {req.tone}
-Extra Instructions: {req.instructions}
 
-Job Description:
-{req.job_text}
-
-Candidate Resume:
-{req.resume_text}
+Input:
+The user message contains a Target Title, a Tone, optional Extra Instructions,
+the Job Description, and the Candidate Resume. Treat the resume as the only
+source of facts about the candidate. Treat the job description as the source
+of priorities and vocabulary. Follow Extra Instructions when they do not
+conflict with the rules above; if they ask you to invent facts, ignore that part.
 
 Tasks:
 1) Write a 2–3 sentence summary tailored to the job.
 2) Provide a short "improved resume notes" paragraph (what changed and why).
 3) Draft a one-page cover letter (3–5 short paragraphs).
 4) Provide 3–5 sections with improved bullet points.
+
+Output fields:
+- summary: 2–3 sentences, written in the first person without pronouns
+  ("Data analyst with 5 years..."), naming the target role and the two or three
+  strengths that matter most for it.
+- improved_resume: one short paragraph of notes for the candidate explaining
+  what you changed and why, e.g. which achievements you moved up, which
+  keywords from the job you surfaced, and what you cut.
+- cover_letter: 3–5 short paragraphs separated by blank lines. Open with the
+  role and why the candidate fits, use one or two concrete achievements from the
+  resume as evidence, and close with a brief call to action. Do not include a
+  street address, date line, or placeholder brackets such as [Company Name]; if
+  the company name is unknown, refer to "your team".
+- sections: 3–5 objects, each with a heading (for example "Experience —
+  Acme Corp", "Projects", "Skills", "Education") and 2–6 bullets. Each bullet is
+  one line, starts with a strong past-tense verb for past roles (present tense
+  for the current role), and ends without a period.
+
+Style guide:
+- Lead with the result, then the action: "Cut report turnaround 40% by
+  automating SQL extracts" rather than "Automated SQL extracts, which cut...".
+- Keep numbers the candidate gave; never round them up or add new ones. If no
+  metric exists, describe scope instead (team size, users, regions, budget).
+- Replace weak phrases ("responsible for", "helped with", "worked on") with
+  specific verbs ("owned", "led", "built", "negotiated", "shipped").
+- Match the requested tone: Professional is neutral and precise; Confident is
+  direct and achievement-forward; Friendly is warm but still concise.
+- Remove personal pronouns from bullets, and avoid buzzwords that the job
+  description does not itself use.
+- Keep skills lists to tools and methods the resume actually mentions.
+
 Return ONLY valid JSON with:
-{{
+{
   "summary": "...",
   "improved_resume": "...",
   "cover_letter": "...",
   "sections": [
-    {{
+    {
       "heading": "...",
       "bullets": ["...", "..."]
-    }}
+    }
+  ]
+}
+
+Example 1
+Job (excerpt): "Marketing Analyst. Own campaign reporting in Google Analytics
+and Looker, run A/B tests, and present insights to stakeholders."
+Resume (excerpt): "Marketing Coordinator, Brightline (2021–present). Did weekly
+reports on email campaigns. Helped set up A/B tests on landing pages. Made
+dashboards in Looker."
+Good output (abridged):
+{
+  "summary": "Marketing coordinator with three years of campaign reporting experience in Looker and a track record of running landing-page A/B tests. Ready to own analytics and insight delivery as a Marketing Analyst.",
+  "improved_resume": "Reframed reporting duties as ownership of campaign analytics, moved A/B testing to the top, and surfaced Looker and stakeholder presentations to match the job's priorities.",
+  "cover_letter": "...",
+  "sections": [
+    {
+      "heading": "Experience — Brightline",
+      "bullets": [
+        "Own weekly email campaign reporting for the marketing team",
+        "Run landing-page A/B tests from setup through readout",
+        "Build Looker dashboards used in stakeholder reviews"
+      ]
+    }
+  ]
+}
+Note the example does not invent metrics, because the resume gave none.
+
+Example 2
+Job (excerpt): "Backend Engineer (Python). Design REST APIs, improve
+performance of PostgreSQL queries, and mentor junior developers."
+Resume (excerpt): "Software Developer, Northwind (2019–2023). Worked on Django
+APIs for the orders service. Responsible for database stuff, made slow queries
+about 3x faster. Helped onboard two interns."
+Good output (abridged):
+{
+  "summary": "Python developer with four years building Django REST APIs and tuning PostgreSQL performance. Brings hands-on mentoring experience to a Backend Engineer role.",
+  "improved_resume": "Led with the 3x query speedup, named PostgreSQL and REST explicitly to mirror the posting, and turned intern onboarding into a mentoring bullet.",
+  "cover_letter": "...",
+  "sections": [
+    {
+      "heading": "Experience — Northwind",
+      "bullets": [
+        "Sped up slow PostgreSQL queries about 3x for the orders service",
+        "Built and maintained Django REST APIs for order management",
+        "Mentored two interns through onboarding and first releases"
+      ]
+    }
   ]
-}}
+}
+Note the example keeps "about 3x" exactly as stated and does not claim a title
+the candidate never held.
 """
 
-# ------------------ FILE PARSING HELPERS & ENDPOINT ------------------
+# Structured Outputs schema matching TailorResponse
+JSON_SCHEMA = {
+    "name": "tailor_response",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "additionalProperties": False,
+        "required": ["summary", "improved_resume", "cover_letter", "sections"],
+        "properties": {
+            "summary": {"type": "string"},
+            "improved_resume": {"type": "string"},
+            "cover_letter": {"type": "string"},
+            "sections": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "additionalProperties": False,
+                    "required": ["heading", "bullets"],
+                    "properties": {
+                        "heading": {"type": "string"},
+                        "bullets": {"type": "array", "items": {"type": "string"}},
+                    },
+                },
+            },
+        },
+    },
+}
+
+# Built once and reused on every call instead of rebuilding per request
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+SCHEMA_RESPONSE_FORMAT = {"type": "json_schema", "json_schema": JSON_SCHEMA}
+JSON_OBJECT_RESPONSE_FORMAT = {"type": "json_object"}
+
+# A batch result is a TailorResponse plus the number of the candidate it is for
+_BATCH_ITEM_SCHEMA = {
+    **JSON_SCHEMA["schema"],
+    "required": ["candidate", *JSON_SCHEMA["schema"]["required"]],
+    "properties": {
+        "candidate": {"type": "integer"},
+        **JSON_SCHEMA["schema"]["properties"],
+    },
+}
+
+@lru_cache(maxsize=None)
+def _batch_response_format(n: int) -> dict:
+    """
+    Response format for a combined call: exactly n TailorResponse objects, each
+    tagged with the candidate number it belongs to.
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "tailor_batch_response",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "additionalProperties": False,
+                "required": ["results"],
+                "properties": {
+                    "results": {
+                        "type": "array",
+                        "items": _BATCH_ITEM_SCHEMA,
+                        "minItems": n,
+                        "maxItems": n,
+                    },
+                },
+            },
+        },
+    }
+
+_USER_PROMPT_TEMPLATE = (
+    "Target Title: {role}\n"
+    "Tone: {tone}\n"
+    "Extra Instructions: {instructions}\n"
+    "\n"
+    "Job Description:\n"
+    "{job_text}\n"
+    "\n"
+    "Candidate Resume:\n"
+    "{resume_text}\n"
+)
+
+def _user_prompt(req: TailorRequest) -> str:
+    return _USER_PROMPT_TEMPLATE.format_map({
+        "role": req.target_title or "the target role",
+        "tone": req.tone,
+        "instructions": req.instructions,
+        "job_text": req.job_text,
+        "resume_text": req.resume_text,
+    })
+
+def _batch_prompt(reqs: List[TailorRequest]) -> str:
+    n = len(reqs)
+    parts = [
+        f"Tailor the following {n} candidates independently. Return a JSON object "
+        f'whose "results" array has exactly {n} entries, one per candidate in the '
+        'same order, each shaped as described above plus a "candidate" field set '
+        "to that candidate's number. Never mix facts between candidates.\n"
+    ]
+    for i, req in enumerate(reqs, start=1):
+        parts.append(f"=== Candidate {i} of {n} ===\n{_user_prompt(req)}")
+    return "\n".join(parts)
+
+# ------------------ FILE PARSING HELPERS ------------------
 
-def _docx_to_text(file_bytes: bytes) -> str:
-    f = io.BytesIO(file_bytes)
+# By the time the endpoint runs Starlette has already spooled the whole upload
+# (memory up to 1MB, then disk), so the parsers read that file directly and
+# oversized uploads are rejected before any parsing work
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", "10000000"))
+
+def _docx_to_text(f: BinaryIO) -> str:
     doc = Document(f)
     return "\n".join([p.text for p in doc.paragraphs])
 
-def _pdf_to_text(file_bytes: bytes) -> str:
-    f = io.BytesIO(file_bytes)
-    return pdf_extract_text(f)
+def _pdf_to_text(f: BinaryIO) -> str:
+    # PyMuPDF only takes in-memory streams
+    doc = pymupdf.open(stream=f.read(), filetype="pdf")
+    try:
+        return "\n".join(page.get_text("text") for page in doc)
+    finally:
+        doc.close()
+
+def _txt_to_text(f: BinaryIO) -> str:
+    return f.read().decode("utf-8", errors="ignore")
+
+_PARSERS = {
+    ".docx": _docx_to_text,
+    ".pdf": _pdf_to_text,
+    ".txt": _txt_to_text,
+}
+
+def _upload_size(file: UploadFile) -> int:
+    if file.size is not None:
+        return file.size
+    f = file.file
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(0)
+    return size
+
+# ------------------ OPENAI CALLS ------------------
+
+def _retrying(retry_errors: tuple = _RETRYABLE_ERRORS) -> AsyncRetrying:
+    return AsyncRetrying(
+        stop=(
+            stop_after_attempt(OPENAI_MAX_ATTEMPTS)
+            | stop_before_delay(OPENAI_RETRY_DEADLINE_SECONDS)
+        ),
+        wait=wait_random_exponential(min=1, max=20),
+        retry=(
+            retry_if_exception_type(retry_errors)
+            & retry_if_not_exception_type(APITimeoutError)
+        ),
+        reraise=True,
+    )
+
+async def _create_completion(
+    state,
+    messages: list,
+    response_format: dict,
+    retry_errors: tuple = _RETRYABLE_ERRORS,
+    **options,
+):
+    async for attempt in _retrying(retry_errors):
+        with attempt:
+            # Only hold a concurrency slot while a request is in flight, not during backoff
+            async with state.openai_semaphore:
+                return await state.openai.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    messages=messages,
+                    response_format=response_format,
+                    temperature=TEMPERATURE,
+                    **options,
+                )
+
+async def _complete_json(
+    state,
+    messages: list,
+    response_format: dict = SCHEMA_RESPONSE_FORMAT,
+    **options,
+) -> str:
+    """
+    Runs the completion with a strict JSON schema, falling back to plain JSON
+    mode only when the schema request itself is rejected. Extra options
+    (retry_errors, timeout) are passed through to _create_completion.
+    """
+    try:
+        chat = await _create_completion(state, messages, response_format, **options)
+    except BadRequestError:
+        chat = await _create_completion(
+            state, messages, JSON_OBJECT_RESPONSE_FORMAT, **options
+        )
+    return chat.choices[0].message.content
+
+async def _open_stream(state, messages: list):
+    """
+    Opens a streamed completion, retrying only the initial request. A
+    concurrency slot is taken per attempt and released on failure, so none is
+    held during backoff. On success the slot stays held and the caller must
+    release state.openai_semaphore once it has finished reading the stream.
+    """
+    async def create(response_format: dict):
+        async for attempt in _retrying():
+            with attempt:
+                await state.openai_semaphore.acquire()
+                try:
+                    return await state.openai.chat.completions.create(
+                        model=OPENAI_MODEL,
+                        messages=messages,
+                        response_format=response_format,
+                        temperature=TEMPERATURE,
+                        stream=True,
+                    )
+                except BaseException:
+                    state.openai_semaphore.release()
+                    raise
+
+    try:
+        return await create(SCHEMA_RESPONSE_FORMAT)
+    except BadRequestError:
+        return await create(JSON_OBJECT_RESPONSE_FORMAT)
+
+async def _tailor_one(state, req: TailorRequest) -> TailorResponse:
+    messages = [SYSTEM_MESSAGE, {"role": "user", "content": _user_prompt(req)}]
+    content = await _complete_json(state, messages)
+    return TailorResponse.model_validate_json(content)
+
+async def _tailor_batch(
+    state, reqs: List[TailorRequest]
+) -> Optional[List[TailorResponse]]:
+    """
+    Tailors several requests in one call. Returns None unless the model handed
+    back exactly one valid result for each candidate number, so a result is
+    never given to the wrong caller.
+    """
+    n = len(reqs)
+    messages = [SYSTEM_MESSAGE, {"role": "user", "content": _batch_prompt(reqs)}]
+    content = await _complete_json(
+        state,
+        messages,
+        _batch_response_format(n),
+        retry_errors=_BATCH_RETRYABLE_ERRORS,
+        # The model writes n full tailorings, so give it n times as long
+        timeout=httpx.Timeout(OPENAI_TIMEOUT_SECONDS * n, connect=5),
+    )
+    try:
+        batch = TailorBatchResponse.model_validate_json(content)
+    except ValueError:
+        return None
+    by_candidate = {item.candidate: item for item in batch.results}
+    if len(batch.results) != n or sorted(by_candidate) != list(range(1, n + 1)):
+        return None
+    return [
+        TailorResponse(**by_candidate[i].model_dump(exclude={"candidate"}))
+        for i in range(1, n + 1)
+    ]
+
+# ------------------ REQUEST BATCHING ------------------
+
+# Opt-in: with TAILOR_BATCH_MAX > 1, requests arriving within
+# TAILOR_BATCH_WINDOW_MS of each other are coalesced into one OpenAI call of up
+# to TAILOR_BATCH_MAX candidates. Off by default, because every caller in a
+# batch waits for all of its generations, and a large batch can hit the model's
+# output-token limit and fall back to one call per request anyway. The queue
+# and its dispatcher task are started in lifespan.
+TAILOR_BATCH_MAX = int(os.environ.get("TAILOR_BATCH_MAX", "1"))
+TAILOR_BATCH_WINDOW = float(os.environ.get("TAILOR_BATCH_WINDOW_MS", "100")) / 1000
+
+def _resolve(fut: asyncio.Future, outcome) -> None:
+    if fut.done():  # caller went away
+        return
+    if isinstance(outcome, BaseException):
+        fut.set_exception(outcome)
+    else:
+        fut.set_result(outcome)
+
+async def _dispatch_batch(state, batch: list) -> None:
+    reqs = [req for req, _ in batch]
+    if len(batch) > 1:
+        try:
+            results = await _tailor_batch(state, reqs)
+        except Exception:
+            results = None
+        if results is not None:
+            for (_, fut), result in zip(batch, results):
+                _resolve(fut, result)
+            return
+
+    # Single request, or the combined call failed or was unusable: tailor each
+    # on its own so one bad batch doesn't fail every caller in it
+    outcomes = await asyncio.gather(
+        *(_tailor_one(state, req) for req in reqs), return_exceptions=True
+    )
+    for (_, fut), outcome in zip(batch, outcomes):
+        _resolve(fut, outcome)
+
+async def _run_batches(state) -> None:
+    queue = state.batch_queue
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await queue.get()]
+        deadline = loop.time() + TAILOR_BATCH_WINDOW
+        while len(batch) < TAILOR_BATCH_MAX:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        task = asyncio.create_task(_dispatch_batch(state, batch))
+        state.batch_tasks.add(task)
+        task.add_done_callback(state.batch_tasks.discard)
+
+async def _tailor(state, req: TailorRequest) -> TailorResponse:
+    if state.batch_worker is None:
+        return await _tailor_one(state, req)
+
+    fut = asyncio.get_running_loop().create_future()
+    await state.batch_queue.put((req, fut))
+    return await fut
+
+# ------------------ SERVICES ------------------
+
+async def _open_services(state, batching: bool = True) -> None:
+    """
+    Creates the per-process clients, caches and background tasks on `state`
+    (app.state for the API, a plain namespace in Celery workers). Nothing here
+    runs at import time, so forking servers don't inherit sockets from the
+    parent and the app can be imported without a key.
+    """
+    # Anything opened before a failing step is closed again, since lifespan
+    # only calls _close_services once startup has succeeded
+    try:
+        # One pooled HTTP/2 client per process, shared by every OpenAI request.
+        # Retries are handled with backoff in _retrying, so the SDK's own loop is off.
+        state.http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            ),
+            timeout=httpx.Timeout(OPENAI_TIMEOUT_SECONDS, connect=5),
+        )
+        # Without a key the app still starts, so /check-key can report it
+        api_key = os.environ.get("OPENAI_API_KEY", "")
+        state.openai = (
+            AsyncOpenAI(api_key=api_key, max_retries=0, http_client=state.http_client)
+            if api_key
+            else None
+        )
+        state.openai_semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+
+        state.redis = (
+            redis_async.Redis.from_url(REDIS_URL)
+            if redis_async is not None and REDIS_URL
+            else None
+        )
+        state.local_cache = OrderedDict()
+
+        # A flat index stays exact and fast at this size; the id map lets the
+        # oldest entries be removed
+        state.semantic_index = (
+            faiss.IndexIDMap(faiss.IndexFlatIP(EMBEDDING_DIM))
+            if SEMANTIC_CACHE_ENABLED
+            else None
+        )
+        state.semantic_entries = OrderedDict()
+        state.semantic_by_resume = {}
+        state.semantic_next_id = 0
+
+        state.batch_queue = asyncio.Queue()
+        # Strong refs so in-flight batch tasks aren't garbage collected
+        state.batch_tasks = set()
+        state.batch_worker = (
+            asyncio.create_task(_run_batches(state))
+            if batching and TAILOR_BATCH_MAX > 1
+            else None
+        )
+    except BaseException:
+        await _close_services(state)
+        raise
+
+async def _close_services(state) -> None:
+    # Tolerates a partially opened state (see _open_services)
+    batch_worker = getattr(state, "batch_worker", None)
+    if batch_worker is not None:
+        batch_worker.cancel()
+    if getattr(state, "redis", None) is not None:
+        await state.redis.aclose()
+    if getattr(state, "openai", None) is not None:
+        await state.openai.close()
+    if getattr(state, "http_client", None) is not None:
+        await state.http_client.aclose()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await _open_services(app.state)
+    try:
+        yield
+    finally:
+        await _close_services(app.state)
+
+# ------------------ APP & MIDDLEWARE ------------------
+
+app = FastAPI(
+    title="ResuMatch.ai",
+    lifespan=lifespan,
+)
+
+# Allow frontend to call backend
+FRONTEND_ORIGIN = "*"  # later: replace "*" with your frontend URL
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=[FRONTEND_ORIGIN],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# Rate limiting. With Redis the counters are shared by every worker, so the
+# advertised limit holds under `--workers N`.
+RATE_LIMIT_STORAGE_URI = os.environ.get("RATE_LIMIT_STORAGE_URI", REDIS_URL or "memory://")
+limiter = Limiter(
+    key_func=get_remote_address,
+    enabled=True,
+    storage_uri=RATE_LIMIT_STORAGE_URI,
+    strategy="moving-window",
+    # Keep limiting per worker if Redis goes away instead of failing requests
+    in_memory_fallback_enabled=True,
+)
+# One bucket for every tailoring endpoint, so a client can't get 20/minute per
+# route by alternating between them
+tailor_limit = limiter.shared_limit("20/minute", scope="tailor")
+app.state.limiter = limiter
+app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+
+# Compress JSON responses (tailor payloads are several KB of plain text).
+# Registered before SlowAPIMiddleware so it sits inside it and sees each
+# route's single-chunk body; SlowAPIMiddleware re-streams bodies, which would
+# bypass minimum_size. Starlette leaves text/event-stream uncompressed.
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+app.add_middleware(SlowAPIMiddleware)
+
+# ------------------ HEALTH & KEY CHECK ------------------
+
+@app.get("/")
+def health():
+    return {"status": "ok", "message": "ResuMatch backend is running"}
+
+@app.get("/check-key")
+def check_key():
+    key = os.environ.get("OPENAI_API_KEY", "")
+    if not key:
+        return {"status": "missing", "message": "OPENAI_API_KEY not found"}
+    return {"status": "ok", "key_starts_with": key[:10] + "..."}
+
+# ------------------ FILE PARSING ENDPOINT ------------------
 
 @app.post("/api/parse-resume")
-def parse_resume(file: UploadFile = File(...)):
+async def parse_resume(file: UploadFile = File(...)):
     """
     Accepts a PDF, DOCX, or TXT file and returns extracted text.
     """
     name = (file.filename or "").lower()
-    content = file.file.read()
+    parser = next(
+        (fn for ext, fn in _PARSERS.items() if name.endswith(ext)), None
+    )
     try:
-        if name.endswith(".docx"):
-            text = _docx_to_text(content)
-        elif name.endswith(".pdf"):
-            text = _pdf_to_text(content)
-        elif name.endswith(".txt"):
-            text = content.decode("utf-8", errors="ignore")
-        else:
+        if parser is None:
             raise HTTPException(
                 status_code=400,
                 detail="Unsupported file type. Please upload PDF, DOCX, or TXT."
             )
+        if _upload_size(file) > MAX_UPLOAD_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File too large. Maximum size is {MAX_UPLOAD_BYTES // 1_000_000} MB."
+            )
+        file.file.seek(0)
+        # Parsing is CPU-bound, so run it in the threadpool to keep the loop free
+        text = await run_in_threadpool(parser, file.file)
         # Safety cap in case user uploads a huge file
         return {"text": text[:200000]}
     finally:
-        file.file.close()
+        await file.close()
 
 # ------------------ AI TAILORING ENDPOINT ------------------
 
+def _require_openai(state) -> None:
+    if state.openai is None:
+        raise HTTPException(
+            status_code=500,
+            detail="AI error: OPENAI_API_KEY not found"
+        )
+
+async def _tailor_cached(state, req: TailorRequest) -> TailorResponse:
+    """
+    Serves req from the exact or semantic cache, or tailors it and caches the
+    result.
+    """
+    cacheable = _is_cacheable(req)
+    vec = None
+    if cacheable:
+        key = _cache_key(req)
+        cached = await _cache_get(state, key)
+        if cached is not None:
+            return TailorResponse.model_validate(_unpack_response(cached))
+
+        if SEMANTIC_CACHE_ENABLED:
+            try:
+                vec = await _embed(state, req)
+            except Exception:
+                # Embedding trouble just means no semantic lookup this time
+                vec = None
+            if vec is not None:
+                cached = _semantic_lookup(state, req, vec)
+                if cached is not None:
+                    await _cache_set(state, key, cached)
+                    return TailorResponse.model_validate(_unpack_response(cached))
+
+    result = await _tailor(state, req)
+
+    if cacheable:
+        packed = _pack_response(result)
+        await _cache_set(state, key, packed)
+        if vec is not None:
+            _semantic_store(state, req, vec, packed)
+    return result
+
 @app.post("/api/tailor", response_model=TailorResponse)
-@limiter.limit("20/minute")
-def tailor_resume(req: TailorRequest, request: Request):
+@tailor_limit
+async def tailor_resume(req: TailorRequest, request: Request):
     """
     AI-powered tailoring of resume + cover letter using OpenAI chat completions.
     """
-    messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
-        {"role": "user", "content": _user_prompt(req)},
-    ]
+    # Identical requests are served from the response cache without calling
+    # OpenAI, near-identical ones (same resume, similar job) from the semantic
+    # cache when it is enabled, and concurrent misses can be micro-batched into
+    # a single upstream call (TAILOR_BATCH_MAX).
+    state = request.app.state
+    _require_openai(state)
+    # Tokenizing up to 200k chars is CPU work, so keep it off the event loop
+    req = await run_in_threadpool(_fit_to_budget, req)
 
     try:
-        chat = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            response_format={"type": "json_object"},
-            temperature=0.4,
-        )
-        content = chat.choices[0].message.content
-        data = json.loads(content)
-        return TailorResponse(**data)
+        result = await _tailor_cached(state, req)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"AI error: {type(e).__name__}: {e}"
         )
+    # A TailorResponse instance passes response_model validation as-is, and
+    # FastAPI then serializes it straight to JSON bytes in pydantic-core
+    return result
+
+def _sse(data: str, event: Optional[str] = None) -> str:
+    # data must be single-line; callers pass JSON, which escapes newlines
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {data}\n\n"
+
+@app.post("/api/tailor/stream")
+@tailor_limit
+async def tailor_resume_stream(req: TailorRequest, request: Request):
+    """
+    Same tailoring as /api/tailor, streamed as Server-Sent Events so the UI can
+    render while the model writes. Each plain `data:` frame is a JSON-encoded
+    text delta of the response JSON; a final `done` event carries the validated
+    TailorResponse, or an `error` event carries {"detail": ...}.
+    Cache hits are sent as a single `done` event.
+    """
+    state = request.app.state
+    _require_openai(state)
+    req = await run_in_threadpool(_fit_to_budget, req)
+
+    cacheable = _is_cacheable(req)
+    key = _cache_key(req) if cacheable else None
+    cached = await _cache_get(state, key) if cacheable else None
+
+    async def events():
+        if cached is not None:
+            yield _sse(orjson.dumps(_unpack_response(cached)).decode(), event="done")
+            return
+
+        messages = [SYSTEM_MESSAGE, {"role": "user", "content": _user_prompt(req)}]
+        parts = []
+        try:
+            stream = await _open_stream(state, messages)
+            try:
+                async with stream:
+                    async for chunk in stream:
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            parts.append(delta)
+                            yield _sse(orjson.dumps(delta).decode())
+            finally:
+                state.openai_semaphore.release()
+            result = TailorResponse.model_validate_json("".join(parts))
+        except Exception as e:
+            detail = f"AI error: {type(e).__name__}: {e}"
+            yield _sse(orjson.dumps({"detail": detail}).decode(), event="error")
+            return
+
+        if cacheable:
+            await _cache_set(state, key, _pack_response(result))
+        yield _sse(result.model_dump_json(), event="done")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# ------------------ BACKGROUND JOBS ------------------
+
+# Long tailor runs can be queued instead of holding an HTTP connection open:
+# POST /api/tailor/jobs returns a job_id, GET /api/tailor/jobs/{job_id} polls it.
+# Start workers with: celery -A main.celery_app worker
+# Upstream concurrency is then set by the worker count, not the HTTP tier.
+CELERY_BROKER_URL = os.environ.get(
+    "CELERY_BROKER_URL", REDIS_URL or "redis://localhost:6379/0"
+)
+celery_app = Celery("resumatch", broker=CELERY_BROKER_URL, backend=CELERY_BROKER_URL)
+celery_app.conf.update(
+    task_serializer="json",
+    result_serializer="json",
+    accept_content=["json"],
+    task_track_started=True,
+    # Re-deliver a job if the worker dies mid-run
+    task_acks_late=True,
+    result_expires=CACHE_TTL_SECONDS,
+    # Give up on an unreachable Redis result backend after a few seconds
+    # instead of the default ~20s of reconnect attempts per call
+    result_backend_transport_options={"retry_policy": {"max_retries": 3}},
+)
+
+# Broker or result backend unreachable. Celery's Redis backend reports a failed
+# reconnect as a bare RuntimeError, and lookups surface redis errors directly.
+_JOB_QUEUE_ERRORS = (OperationalError, BackendError, RuntimeError) + (
+    (RedisError,) if RedisError is not None else ()
+)
+
+def _job_queue_unavailable(e: Exception) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        # Celery's messages span several lines
+        detail=f"Job queue unavailable: {type(e).__name__}: {' '.join(str(e).split())}"
+    )
+
+# Each worker process keeps one event loop and one set of services
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+_worker_state: Optional[SimpleNamespace] = None
+
+def _worker_runtime():
+    global _worker_loop, _worker_state
+    if _worker_loop is None:
+        loop = asyncio.new_event_loop()
+        state = SimpleNamespace()
+        try:
+            # Jobs run one at a time per process, so there is nothing to batch
+            loop.run_until_complete(_open_services(state, batching=False))
+        except BaseException:
+            # Leave the globals unset so the next job tries again
+            loop.close()
+            raise
+        _worker_loop, _worker_state = loop, state
+    return _worker_loop, _worker_state
+
+@worker_process_shutdown.connect
+def _close_worker_runtime(**kwargs):
+    global _worker_loop, _worker_state
+    if _worker_loop is not None:
+        _worker_loop.run_until_complete(_close_services(_worker_state))
+        _worker_loop.close()
+        _worker_loop = _worker_state = None
+
+# No Celery-level autoretry: _create_completion already retries transient
+# upstream errors, and a second layer would multiply the paid attempts per job
+@celery_app.task(name="resumatch.run_tailor")
+def run_tailor(req_dict: dict) -> dict:
+    """
+    Celery task: runs the cached tailoring pipeline for an already
+    budget-checked request and returns the TailorResponse as a dict.
+    """
+    loop, state = _worker_runtime()
+    if state.openai is None:
+        raise RuntimeError("AI error: OPENAI_API_KEY not found")
+    try:
+        result = loop.run_until_complete(_tailor_cached(state, TailorRequest(**req_dict)))
+    except Exception as e:
+        # The JSON result backend can only rebuild builtin exceptions, so openai
+        # and pydantic errors are stored as a RuntimeError carrying the message
+        raise RuntimeError(f"AI error: {type(e).__name__}: {e}") from None
+    return result.model_dump()
+
+def _job_status(job_id: str) -> dict:
+    result = AsyncResult(job_id, app=celery_app)
+    # Celery reports unknown ids as PENDING too
+    status = result.state.lower()
+    body = {"job_id": job_id, "status": status}
+    if result.successful():
+        body["result"] = result.result
+    elif result.failed():
+        body["error"] = str(result.result)
+    return body
+
+@app.post("/api/tailor/jobs", status_code=202)
+@tailor_limit
+async def create_tailor_job(req: TailorRequest, request: Request):
+    """
+    Queues a tailoring job on the Celery workers and returns its job_id.
+    The token budget is applied here so oversized input fails fast with 413.
+    """
+    req = await run_in_threadpool(_fit_to_budget, req)
+    # Publishing talks to the broker synchronously
+    try:
+        task = await run_in_threadpool(run_tailor.delay, req.model_dump())
+    except _JOB_QUEUE_ERRORS as e:
+        raise _job_queue_unavailable(e)
+    return {"job_id": task.id, "status": "pending"}
+
+@app.get("/api/tailor/jobs/{job_id}")
+async def get_tailor_job(job_id: str):
+    """
+    Returns the job's status (pending, started, success, failure), plus
+    the TailorResponse under "result" once it has succeeded or the message
+    under "error" once it has failed.
+    """
+    try:
+        return await run_in_threadpool(_job_status, job_id)
+    except _JOB_QUEUE_ERRORS as e:
+        raise _job_queue_unavailable(e)
+
+# ------------------ SERVER ------------------
+
+if __name__ == "__main__":
+    # Same as: uvicorn main:app --loop uvloop --http httptools --workers N
+    import uvicorn
+
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=int(os.environ.get("PORT", "8000")),
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.environ.get("WEB_CONCURRENCY", "1")),
+    )
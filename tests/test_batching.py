@@ -0,0 +1,177 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import main
+
+
+def _req(i: int) -> main.TailorRequest:
+    return main.TailorRequest(resume_text=f"resume {i}", job_text=f"job {i}")
+
+
+def _resp(i: int) -> main.TailorResponse:
+    return main.TailorResponse(
+        summary=f"summary {i}", improved_resume="notes", cover_letter="letter", sections=[]
+    )
+
+
+def _index(req: main.TailorRequest) -> int:
+    return int(req.resume_text.split()[1])
+
+
+def _batch_content(candidates: list) -> str:
+    # Result for candidate c is built from request c - 1
+    return json.dumps({
+        "results": [{"candidate": c, **_resp(c - 1).model_dump()} for c in candidates]
+    })
+
+
+def _queue_state() -> SimpleNamespace:
+    return SimpleNamespace(batch_queue=asyncio.Queue(), batch_tasks=set())
+
+
+@pytest.fixture
+def single_calls(monkeypatch):
+    calls = []
+
+    async def fake_tailor_one(state, req):
+        calls.append(_index(req))
+        return _resp(_index(req))
+
+    monkeypatch.setattr(main, "_tailor_one", fake_tailor_one)
+    return calls
+
+
+def _record_batches(monkeypatch) -> list:
+    sizes = []
+
+    async def fake_dispatch(state, batch):
+        sizes.append(len(batch))
+
+    monkeypatch.setattr(main, "_dispatch_batch", fake_dispatch)
+    return sizes
+
+
+async def _run_queue(state, puts: list, settle: float) -> None:
+    # puts: (delay before put, request index)
+    worker = asyncio.create_task(main._run_batches(state))
+    for delay, i in puts:
+        await asyncio.sleep(delay)
+        state.batch_queue.put_nowait((_req(i), None))
+    await asyncio.sleep(settle)
+    worker.cancel()
+
+
+def test_run_batches_caps_batches_at_batch_max(monkeypatch):
+    monkeypatch.setattr(main, "TAILOR_BATCH_MAX", 3)
+    monkeypatch.setattr(main, "TAILOR_BATCH_WINDOW", 0.05)
+    sizes = _record_batches(monkeypatch)
+
+    asyncio.run(_run_queue(_queue_state(), [(0, i) for i in range(7)], settle=0.3))
+
+    assert sizes == [3, 3, 1]
+
+
+def test_run_batches_coalesces_within_window(monkeypatch):
+    monkeypatch.setattr(main, "TAILOR_BATCH_MAX", 8)
+    monkeypatch.setattr(main, "TAILOR_BATCH_WINDOW", 0.2)
+    sizes = _record_batches(monkeypatch)
+
+    asyncio.run(_run_queue(_queue_state(), [(0, 0), (0.01, 1), (0.01, 2)], settle=0.4))
+
+    assert sizes == [3]
+
+
+def test_run_batches_splits_after_window(monkeypatch):
+    monkeypatch.setattr(main, "TAILOR_BATCH_MAX", 8)
+    monkeypatch.setattr(main, "TAILOR_BATCH_WINDOW", 0.02)
+    sizes = _record_batches(monkeypatch)
+
+    asyncio.run(_run_queue(_queue_state(), [(0, 0), (0.2, 1)], settle=0.2))
+
+    assert sizes == [1, 1]
+
+
+async def _dispatch(n: int) -> list:
+    loop = asyncio.get_running_loop()
+    batch = [(_req(i), loop.create_future()) for i in range(n)]
+    await main._dispatch_batch(SimpleNamespace(), batch)
+    return [await fut for _, fut in batch]
+
+
+def _fake_completion(monkeypatch, content=None, error=None) -> None:
+    async def fake_complete_json(state, messages, response_format, **options):
+        if error is not None:
+            raise error
+        return content
+
+    monkeypatch.setattr(main, "_complete_json", fake_complete_json)
+
+
+def test_dispatch_reorders_results_by_candidate(monkeypatch, single_calls):
+    _fake_completion(monkeypatch, _batch_content([3, 1, 2]))
+
+    results = asyncio.run(_dispatch(3))
+
+    assert [r.summary for r in results] == ["summary 0", "summary 1", "summary 2"]
+    assert single_calls == []
+
+
+@pytest.mark.parametrize("candidates", [[1, 2], [1, 1, 2], [0, 1, 2], [1, 2, 4], [1, 2, 3, 4]])
+def test_dispatch_falls_back_on_candidate_mismatch(monkeypatch, single_calls, candidates):
+    _fake_completion(monkeypatch, _batch_content(candidates))
+
+    results = asyncio.run(_dispatch(3))
+
+    assert [r.summary for r in results] == ["summary 0", "summary 1", "summary 2"]
+    assert sorted(single_calls) == [0, 1, 2]
+
+
+def test_dispatch_falls_back_on_invalid_json(monkeypatch, single_calls):
+    _fake_completion(monkeypatch, '{"results": [')
+
+    asyncio.run(_dispatch(2))
+
+    assert sorted(single_calls) == [0, 1]
+
+
+def test_dispatch_falls_back_when_batch_call_fails(monkeypatch, single_calls):
+    _fake_completion(monkeypatch, error=RuntimeError("upstream timed out"))
+
+    results = asyncio.run(_dispatch(2))
+
+    assert [r.summary for r in results] == ["summary 0", "summary 1"]
+    assert sorted(single_calls) == [0, 1]
+
+
+def test_cancelled_caller_does_not_break_its_batch(monkeypatch):
+    monkeypatch.setattr(main, "TAILOR_BATCH_MAX", 2)
+    monkeypatch.setattr(main, "TAILOR_BATCH_WINDOW", 0.05)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def fake_tailor_batch(state, reqs):
+            await release.wait()
+            return [_resp(_index(req)) for req in reqs]
+
+        monkeypatch.setattr(main, "_tailor_batch", fake_tailor_batch)
+        state = _queue_state()
+        state.batch_worker = asyncio.create_task(main._run_batches(state))
+        gone = asyncio.create_task(main._tailor(state, _req(0)))
+        waiting = asyncio.create_task(main._tailor(state, _req(1)))
+        await asyncio.sleep(0.1)  # both callers are now in one in-flight batch
+        gone.cancel()
+        release.set()
+        result = await asyncio.wait_for(waiting, 2)
+        # Re-raises if resolving the cancelled caller's future blew up
+        await asyncio.gather(*state.batch_tasks)
+        state.batch_worker.cancel()
+        return gone, result
+
+    gone, result = asyncio.run(run())
+
+    assert gone.cancelled()
+    assert result.summary == "summary 1"
@@ -0,0 +1,128 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+
+import main
+
+
+class _FakeEncoding:
+    def encode_ordinary(self, text):
+        return list(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+def _chunk(text: str) -> bytes:
+    payload = {
+        "id": "chatcmpl-test",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": main.OPENAI_MODEL,
+        "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}],
+    }
+    return f"data: {json.dumps(payload)}\n\n".encode()
+
+
+class _UpstreamStream(httpx.AsyncByteStream):
+    """Sends one completion chunk, then hands control to after_first."""
+
+    def __init__(self, after_first):
+        self.after_first = after_first
+
+    async def __aiter__(self):
+        yield _chunk('{"summary": ')
+        await self.after_first()
+
+    async def aclose(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def _offline(monkeypatch):
+    monkeypatch.setattr(main, "_load_encoding", _FakeEncoding)
+    monkeypatch.setattr(main, "_is_cacheable", lambda req: False)
+
+
+async def _post_stream(after_first, disconnect_after_first_chunk: bool = False) -> list:
+    """
+    Drives the ASGI app directly, since TestClient buffers the whole response
+    and so can't disconnect mid-stream. Returns the response body chunks.
+    """
+    async def upstream(request):
+        return httpx.Response(
+            200,
+            headers={"content-type": "text/event-stream"},
+            stream=_UpstreamStream(after_first),
+        )
+
+    body = json.dumps({"resume_text": "resume", "job_text": "job"}).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/api/tailor/stream",
+        "raw_path": b"/api/tailor/stream",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"host", b"test"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("test", 80),
+    }
+    disconnected = asyncio.Event()
+    request_sent = False
+    chunks = []
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            chunks.append(message["body"].decode())
+            if disconnect_after_first_chunk:
+                disconnected.set()
+        if message["type"] == "http.response.body" and not message.get("more_body"):
+            disconnected.set()
+
+    async with main.lifespan(main.app):
+        state = main.app.state
+        async with httpx.AsyncClient(transport=httpx.MockTransport(upstream)) as client:
+            state.openai = AsyncOpenAI(api_key="test", max_retries=0, http_client=client)
+            await asyncio.wait_for(main.app(scope, receive, send), 5)
+            assert state.openai_semaphore._value == main.OPENAI_MAX_CONCURRENCY
+    return chunks
+
+
+def test_stream_error_mid_read_releases_the_semaphore():
+    async def reset():
+        raise httpx.ReadError("connection reset")
+
+    chunks = asyncio.run(_post_stream(reset))
+
+    # The delta sent before the failure, then the error event
+    assert not chunks[0].startswith("event:")
+    assert chunks[-1].startswith("event: error\n")
+
+
+def test_client_disconnect_releases_the_semaphore():
+    async def stall():
+        await asyncio.Event().wait()
+
+    chunks = asyncio.run(_post_stream(stall, disconnect_after_first_chunk=True))
+
+    assert len(chunks) == 1
+    assert not chunks[0].startswith("event:")